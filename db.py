@@ -1,4 +1,6 @@
+import json
 import sqlite3
+import pandas as pd
 from contextlib import contextmanager
 from pathlib import Path
 from typing import Optional
@@ -57,6 +59,34 @@ def init_db():
             FOREIGN KEY(user_id) REFERENCES users(id),
             FOREIGN KEY(attached_file_id) REFERENCES files(id)
         )""")
+        _backfill_declarations(c)
+
+def _backfill_declarations(c):
+    # Разовый перенос: JSON-результаты, обработанные до появления таблицы declarations.
+    # Идемпотентно — берутся только JSON-файлы, на которые ещё не ссылается ни одна декларация.
+    cur = c.execute("""SELECT f.id, f.user_id, f.filename, f.stored_path, f.created_at
+                       FROM files f
+                       WHERE f.mime = 'application/json'
+                         AND NOT EXISTS (SELECT 1 FROM declarations d WHERE d.attached_file_id = f.id)""")
+    for f in cur.fetchall():
+        try:
+            data = json.loads(Path(f["stored_path"]).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        if not isinstance(data, dict):
+            continue
+        goods = data.get("Товары")
+        goods = [g for g in goods if isinstance(g, dict)] if isinstance(goods, list) else []
+        general = data.get("Общая информация")
+        doc_no = general.get("Номер документа") if isinstance(general, dict) else None
+        names = [str(g["Наименование"]) for g in goods if g.get("Наименование")]
+        codes = list(dict.fromkeys(str(g["Код ТНВЭД"]) for g in goods if g.get("Код ТНВЭД")))
+        c.execute(
+            """INSERT INTO declarations(user_id,title,goods_description,tnved_code,attached_file_id,meta_json,created_at)
+               VALUES(?,?,?,?,?,?,?)""",
+            (f["user_id"], doc_no or Path(f["filename"]).stem, "; ".join(names), ", ".join(codes),
+             f["id"], json.dumps(data, ensure_ascii=False), f["created_at"]),
+        )
 
 def get_user_by_email(email: str):
     with get_conn() as c:
@@ -150,9 +180,10 @@ def upsert_user_profile(user_id:int, data:dict):
 
 def add_file(user_id:int, filename:str, mime:str, size:int, stored_path:str):
     with get_conn() as c:
-        c.execute(
+        cur = c.execute(
             "INSERT INTO files(user_id, filename, mime, size_bytes, stored_path) VALUES(?,?,?,?,?)",
             (user_id, filename, mime, size, stored_path),)
+        return cur.lastrowid
 
 def list_files(user_id:int, limit=200):
     with get_conn() as c:
@@ -181,4 +212,36 @@ def list_declarations(user_id:int, limit=200):
                WHERE d.user_id = ? ORDER BY d.created_at DESC LIMIT ?""",
             (user_id, limit),
         )
-        return [dict(r) for r in cur.fetchall()]
\ No newline at end of file
+        return [dict(r) for r in cur.fetchall()]
+
+def get_last_activity(user_id:int):
+    # CURRENT_TIMESTAMP с точностью до секунды, поэтому в ключ кэша входит и число деклараций
+    with get_conn() as c:
+        cur = c.execute(
+            "SELECT MAX(created_at) AS last_at, COUNT(*) AS n FROM declarations WHERE user_id = ?",
+            (user_id,),
+        )
+        row = cur.fetchone()
+        return (row["last_at"], row["n"])
+
+def read_declaration_items(user_id:int) -> pd.DataFrame:
+    # Одна выборка: декларации + позиции "Товары" из meta_json (json_each), без запросов по каждому файлу.
+    # Пути с кириллицей совпадают только с неэкранированными ключами: meta_json пишется с ensure_ascii=False.
+    with get_conn() as c:
+        return pd.read_sql_query(
+            """SELECT d.id AS declaration_id, d.created_at, i.key AS item_idx,
+                      json_extract(d.meta, '$."Поставщик"."Название компании"') AS supplier,
+                      json_extract(i.value, '$."Наименование"') AS item_name,
+                      json_extract(i.value, '$."Валюта"') AS currency,
+                      json_extract(i.value, '$."Стоимость"') AS amount,
+                      json_extract(i.value, '$."Код ТНВЭД"') AS tnved_code
+               FROM (
+                   SELECT id, created_at,
+                          CASE WHEN json_valid(meta_json) THEN meta_json END AS meta
+                   FROM declarations WHERE user_id = ?
+               ) d
+               LEFT JOIN json_each(d.meta, '$."Товары"') i ON i.type = 'object'
+               ORDER BY d.created_at""",
+            c,
+            params=(user_id,),
+        )
\ No newline at end of file
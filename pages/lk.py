@@ -1,6 +1,6 @@
 import streamlit as st
 from pathlib import Path
-from db import list_files, add_declaration, add_file, list_files, update_user, get_user_profile, upsert_user_profile, get_user_by_id
+from db import list_files, add_declaration, add_file, list_files, update_user, get_user_profile, upsert_user_profile, get_user_by_id, get_last_activity, read_declaration_items
 from pdf2image import convert_from_path
 import base64
 import re
@@ -10,6 +10,7 @@ from datetime import datetime
 from typing import Optional
 import fitz  
 import pandas as pd
+import numpy as np
 import os
 from openai import OpenAI
 
@@ -98,15 +99,97 @@ def make_lm_client():
 
 LM_MODEL = "google/gemma-3-12b"  # Модель LM Studio
 
+def _parse_amounts(s: pd.Series) -> pd.Series:
+    """Стоимость из JSON -> float. Числа (REAL/INTEGER из json_extract) возвращаются как есть.
+
+    В строке символы валюты и буквы отбрасываются, последний из "." / "," считается десятичным:
+    "1.234,50" -> 1234.5, "1,234.500" -> 1234.5, "2 500.000" -> 2500.0, "0.250" -> 0.25, "12,5" -> 12.5,
+    "$100" / "100 USD" -> 100.0. Исключение — разделитель тысяч: в строке один вид разделителя без групп
+    через пробел, после последнего ровно 3 цифры, а перед ним ненулевое целое: "1,234" -> 1234.0,
+    "1.234.567" -> 1234567.0.
+    """
+    is_str = s.map(lambda v: isinstance(v, str)).to_numpy(dtype=bool)
+    numeric = pd.to_numeric(s.where(~is_str), errors="coerce")
+
+    raw = s.where(is_str).astype("string").fillna("")
+    space_group = raw.str.contains(r"\d[\s\u00a0]\d{3}(?!\d)", regex=True).to_numpy(dtype=bool)
+    clean = raw.str.replace(r"[^\d.,-]", "", regex=True)
+    mixed = (clean.str.contains(".", regex=False) & clean.str.contains(",", regex=False)).to_numpy(dtype=bool)
+    parts = clean.str.extract(r"^(?P<head>-?[\d.,]*?)[.,](?P<tail>\d*)$")
+    head = parts["head"].fillna("").str.replace(r"[.,]", "", regex=True)
+    tail = parts["tail"].fillna("")
+    has_sep = parts["tail"].notna().to_numpy(dtype=bool)
+    thousands = (
+        (tail.str.len() == 3).to_numpy(dtype=bool)
+        & head.str.fullmatch(r"-?0*[1-9]\d*").to_numpy(dtype=bool)
+        & ~mixed
+        & ~space_group
+    )
+    text = pd.Series(np.where(~has_sep, clean, np.where(thousands, head + tail, head + "." + tail)), index=s.index)
+    return pd.Series(np.where(is_str, pd.to_numeric(text, errors="coerce"), numeric), index=s.index, dtype=float)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def build_analytics(user_id: int, stamp: tuple) -> dict: # Кэш по (последний created_at, число деклараций): пересчёт только при новых данных
+    df = read_declaration_items(user_id)
+    if df.empty:
+        return {}
+    df["created_at"] = pd.to_datetime(df["created_at"], errors="coerce")
+    df["month"] = df["created_at"].dt.to_period("M").astype(str)
+    df["amount"] = _parse_amounts(df["amount"])
+    df["currency"] = df["currency"].astype("string").str.strip().str.upper().replace("", pd.NA)
+    df["supplier"] = df["supplier"].astype("string").str.strip().replace("", pd.NA)
+    df["tnved_code"] = df["tnved_code"].astype("string").str.replace(r"\D", "", regex=True).replace("", pd.NA)
+
+    items = df[df["item_idx"].notna()]
+    priced = items.dropna(subset=["amount", "currency"])
+    value = priced.pivot_table(index="month", columns="currency", values="amount", aggfunc="sum", fill_value=0).sort_index()
+
+    decl = df.drop_duplicates("declaration_id")
+    suppliers = (
+        pd.DataFrame({
+            "declarations": decl.groupby("supplier").size(),
+            "items": items.groupby("supplier").size(),
+        })
+        .fillna(0)
+        .astype(int)
+        .nlargest(10, ["declarations", "items"])
+        .rename_axis("Поставщик")
+        .reset_index()
+        .rename(columns={"declarations": "Деклараций", "items": "Позиций"})
+    )
+
+    codes = items["tnved_code"].dropna()
+    tnved = (
+        codes.str[:4].value_counts()
+        .rename_axis("Товарная позиция (4 знака)")
+        .rename("Позиций")
+        .reset_index()
+    )
+
+    volume = decl.dropna(subset=["created_at"]).set_index("created_at").resample("D").size().rename("Деклараций").rename_axis("Дата")
+
+    return {
+        "value": value,
+        "suppliers": suppliers,
+        "tnved": tnved,
+        "volume": volume,
+        "totals": {
+            "declarations": int(decl.shape[0]),
+            "items": int(items.shape[0]),
+            "codes": int(codes.nunique()),
+        },
+    }
+
 ################## Страница Личного кабинета ##################
 st.set_page_config(page_title="ВЭД-Декларант 2.0", page_icon="🛃", layout="wide")
 user = st.session_state.user
 st.title(f"Личный кабинет")
 
-tab1, tab2, tab3 = st.tabs([
+tab1, tab2, tab3, tab4 = st.tabs([
     "Персональная информация",
     "Создать новую таможенную декларацию",
-    "История"
+    "История",
+    "Аналитика"
 ])
 
 ################## Информация о пользователе ##################
@@ -346,6 +429,8 @@ with tab2:
                     if matched:
                         break
 
+            codes = list(dict.fromkeys(str(item["Код ТНВЭД"]) for item in data_to_save.get("Товары", []) if item.get("Код ТНВЭД")))
+
             ################## Выгрузка json файла ##################
             ts = datetime.now().strftime("%Y%m%d_%H%M%S")
             json_path = pdf_path.parent / f"{pdf_path.stem}_result_{ts}.json"
@@ -353,7 +438,7 @@ with tab2:
             with open(json_path, "wb") as f:
                 f.write(json_bytes)
 
-            add_file(
+            json_file_id = add_file(
                 user["id"],
                 json_path.name,
                 "application/json",
@@ -361,6 +446,18 @@ with tab2:
                 str(json_path)
             )
 
+            ################## Сохранение декларации ##################
+            general = data_to_save.get("Общая информация")
+            doc_no = general.get("Номер документа") if isinstance(general, dict) else None
+            add_declaration(
+                user["id"],
+                doc_no or pdf_path.stem,
+                "; ".join(product_names),
+                ", ".join(codes),
+                json_file_id,
+                json.dumps(data_to_save, ensure_ascii=False),
+            )
+
             st.download_button(
                 label="⬇️ Скачать JSON",
                 data=json_bytes,
@@ -429,3 +526,32 @@ with tab3:
                     st.json(json.loads(file_path.read_text(encoding="utf-8")))
                 except Exception:
                     st.code(file_path.read_text(encoding="utf-8")[:5000])
+
+################## Аналитика ##################
+with tab4:
+    an = build_analytics(user["id"], get_last_activity(user["id"]))
+    if not an:
+        st.info("Деклараций пока нет.")
+    else:
+        m1, m2, m3 = st.columns(3)
+        m1.metric("Деклараций", an["totals"]["declarations"])
+        m2.metric("Товарных позиций", an["totals"]["items"])
+        m3.metric("Кодов ТН ВЭД", an["totals"]["codes"])
+
+        st.subheader("Стоимость товаров по валютам и месяцам")
+        if an["value"].empty:
+            st.caption("Нет позиций с распознанной стоимостью и валютой.")
+        else:
+            st.bar_chart(an["value"])
+            st.dataframe(an["value"], use_container_width=True)
+
+        colA, colB = st.columns(2)
+        with colA:
+            st.subheader("Топ поставщиков")
+            st.dataframe(an["suppliers"], use_container_width=True, hide_index=True)
+        with colB:
+            st.subheader("Распределение кодов ТН ВЭД")
+            st.dataframe(an["tnved"], use_container_width=True, hide_index=True)
+
+        st.subheader("Объём обработки")
+        st.line_chart(an["volume"])